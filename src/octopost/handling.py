@@ -1,8 +1,21 @@
-from io import StringIO
+import os
+import threading
+from collections import OrderedDict,defaultdict
+from io import BytesIO
 from pathlib import Path
 
 import pandas as pd
 
+# replaces the brackets of OpenFOAM vectors, e.g. (0 0 1), with whitespaces
+_BRACKET_TRANS = bytes.maketrans(b'()',b'  ')
+
+# parsed files shared by all readers, keyed by path, mtime, size and read options
+# (DataFrame, bytes) per key, bounded by the number of entries and their memory
+_PARSE_CACHE = OrderedDict()
+_PARSE_CACHE_SIZE = 64
+_PARSE_CACHE_BYTES = 256 * 2**20
+_PARSE_CACHE_LOCK = threading.Lock()
+
 def list_time_dirs(path_to_time_dirs):
     """
     
@@ -18,15 +31,34 @@ def list_time_dirs(path_to_time_dirs):
     
     """
     
-    l = sorted([str(x.name) for x in Path(path_to_time_dirs).glob('[0-9]*')],key=float,reverse=False)
-    l = [Path(path_to_time_dirs,p) for p in l]
+    entries = []
+    
+    try:
+        with os.scandir(path_to_time_dirs) as it:
+            for e in it:
+                if not e.name[:1].isdigit():
+                    continue
+                try:
+                    entries.append((float(e.name),e.name))
+                except ValueError:
+                    pass
+    except FileNotFoundError:
+        # no postProcessing output (yet), treat like an empty case
+        return []
+    
+    entries.sort()
     
-    return l
+    return [Path(path_to_time_dirs,n) for _,n in entries]
 
-def parse_of(file_name,names,usecols=None):
-    """Opens a text file, replaces all brackets, i.e. () with 
-    whitespaces, passes a file stream to the pandas csv read method
-    and returns a pandas DataFrame.  
+def parse_of(file_name,names,usecols=None,header_line=None,dtype=None):
+    """Reads a text file as bytes, replaces all brackets, i.e. () with 
+    whitespaces, passes a byte stream to the pandas csv read method
+    and returns a pandas DataFrame. Files without brackets in their
+    first 4 kB are memory mapped and passed to pandas unchanged.
+    
+    The result is cached as long as the file's modification time and 
+    size do not change, a cache hit returns a shallow copy. The cache 
+    holds at most 64 frames and 256 MB. See clear_cache().
     
     Parameters
     ----------
@@ -38,6 +70,15 @@ def parse_of(file_name,names,usecols=None):
     usecols : list-like or callable, optional
         Return a subset of the columns. For details see: 
         https://pandas.pydata.org/docs/reference/api/pandas.read_csv.html
+    header_line : int, optional
+        Index of the comment line which holds the column names, e.g. 1 for 
+        the residuals. If given, these names with the first one replaced 
+        by 'time' are used instead of names. Files without this line yet 
+        are read with names.
+    dtype : data type or dict of column -> type, optional
+        Type of the columns, skips the type inference of pandas for files
+        with a known content. For details see:
+        https://pandas.pydata.org/docs/reference/api/pandas.read_csv.html
         
     Returns
     -------
@@ -45,14 +86,90 @@ def parse_of(file_name,names,usecols=None):
     
     """
     
-    trantab = str.maketrans('()','  ')
-
     path = Path(file_name)
+    
+    st = os.stat(path)
+    key = (str(path.resolve()),st.st_mtime_ns,st.st_size,_freeze(names),_freeze(usecols),header_line,_freeze(dtype))
+    
+    with _PARSE_CACHE_LOCK:
+        entry = _PARSE_CACHE.get(key)
+        if entry is not None:
+            _PARSE_CACHE.move_to_end(key)
+            return entry[0].copy(deep=False)
+    
+    df = _read_of(path,names,usecols,header_line,dtype)
+    
+    nbytes = int(df.memory_usage(index=True).sum())
+    
+    with _PARSE_CACHE_LOCK:
+        # frames larger than the whole cache are not kept at all
+        if nbytes <= _PARSE_CACHE_BYTES:
+            _PARSE_CACHE[key] = (df,nbytes)
+            total = sum(n for _,n in _PARSE_CACHE.values())
+            while len(_PARSE_CACHE) > _PARSE_CACHE_SIZE or total > _PARSE_CACHE_BYTES:
+                _,(_,n) = _PARSE_CACHE.popitem(last=False)
+                total -= n
+    
+    return df.copy(deep=False)
 
-    with path.open('r') as f:
-        fstream = StringIO(f.read().translate(trantab))
+
+def clear_cache():
+    """Empties the cache of parsed files used by parse_of."""
     
-    df = pd.read_csv(fstream,delim_whitespace=True,header=None,names=names,comment='#',usecols=usecols)
+    with _PARSE_CACHE_LOCK:
+        _PARSE_CACHE.clear()
+
+
+def _freeze(x):
+    
+    # hashable version of the read options for the cache key
+    if isinstance(x,defaultdict):
+        return (str(x.default_factory()),) + _freeze(dict(x))
+    if isinstance(x,dict):
+        return tuple(sorted((k,str(v)) for k,v in x.items()))
+    if isinstance(x,(list,tuple)):
+        return tuple(x)
+    
+    return x
+
+
+def _read_of(path,names,usecols,header_line,dtype):
+    
+    with path.open('rb') as f:
+        head = f.read(4096)
+        
+        if b'(' in head or b')' in head or not head:
+            # translate the raw bytes, pandas decodes the buffer itself,
+            # empty files end up here too as they cannot be memory mapped
+            f.seek(0)
+            fstream = BytesIO(f.read().translate(_BRACKET_TRANS))
+            memory_map = False
+        else:
+            # no vectors in the file, pandas can map it directly
+            fstream = path
+            memory_map = True
+    
+    if header_line is not None:
+        # take the names from the header of the bytes we already read, a
+        # freshly started file may not have it yet, keep names then
+        lines = head.split(b'\n',header_line + 1)
+        header = lines[header_line].decode().replace('#','').split() if len(lines) > header_line else []
+        if header:
+            names = header
+            names[0] = 'time'
+    
+    # sep=r'\s+' is the C tokenizer's whitespace mode (delim_whitespace is
+    # deprecated), a plain ' ' would break on the tab separated files
+    df = pd.read_csv(fstream,sep=r'\s+',engine='c',memory_map=memory_map,header=None,names=names,comment='#',usecols=usecols,dtype=dtype)
+    
+    if names == PADDING_NAMES:
+        # the padding has to cover the widest line of the file, drop the trailing
+        # columns no line reached. Copy, a slice would keep the padding alive
+        ncols = len(df.columns)
+        while ncols > 1 and df.iloc[:,ncols - 1].isna().all():
+            ncols -= 1
+        if ncols < len(df.columns):
+            df = df.iloc[:,:ncols].copy()
 
     return df
 
@@ -61,4 +178,7 @@ def dummy_columns(n=99):
     
     names = ['time'] + ['c' + str(x) for x in range(n)]
     
-    return names 
+    return names
+
+# names used by readers which don't know the columns of their files
+PADDING_NAMES = dummy_columns()
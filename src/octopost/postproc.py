@@ -1,6 +1,9 @@
 #!/usr/bin/env python3
 
+import os
 import sys
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 import numpy as np
@@ -23,9 +26,14 @@ def makeRuntimeSelectableReader(reader_name,base_dir,case_dir=None):
     
     return reader
 
+def _single_precision():
+    """dtype for read_csv: float32 data columns and a float64 time column."""
+    
+    return defaultdict(lambda: np.float32,time=np.float64)
+
 class OpenFOAMpostProcessing(object):
 
-    def combine_oftime_files(self,file_name,names,usecols):      
+    def combine_oftime_files(self,file_name,names,usecols,header_line=None,dtype=None):      
 
         time_dirs = list_time_dirs(self.base_dir)
             
@@ -38,7 +46,7 @@ class OpenFOAMpostProcessing(object):
             self.data = pd.DataFrame()
             return
         
-        current_mtime = np.amax([Path(td,file_name).stat().st_mtime for td in time_dirs])
+        current_mtime = max(os.stat(os.path.join(td,file_name)).st_mtime for td in time_dirs)
         
         verbose = True
         if current_mtime == self.mtime: # no need to reload
@@ -46,51 +54,57 @@ class OpenFOAMpostProcessing(object):
             self.up_to_date = True
         else:
             self.up_to_date = False
-            self.mtime = current_mtime
+            
+            # reading and tokenizing release the GIL, parse the time dirs concurrently
+            # map() keeps the order of time_dirs
+            with ThreadPoolExecutor(max_workers=min(8,len(time_dirs))) as ex:
+                dfs = list(ex.map(lambda td: parse_of(Path(td,file_name),names,usecols,header_line,dtype),time_dirs))
             
             tmp_data = []
         
-            for td in time_dirs:
-                p = Path(td,file_name)
-                df = parse_of(p,names,usecols)
+            for df in dfs:
                 try:
                     tmp_data.append(df.set_index('time'))
                 except KeyError as e:
                     tmp_data.append(df.set_index(0))
         
-            d = tmp_data[-1]
-               
-            if len(tmp_data) > 1:
-                for i in reversed(tmp_data[:-1]):
-                    if i.index.array[-1] > d.index.array[-1]: 
-                        i = i[i.index < d.index.array[-1]]
-                    d = d.combine_first(i)
+            # newer time dirs win: cut each frame at the start time of its successor
+            # and concatenate once instead of calling combine_first pairwise
+            tmp_data = [df for df in tmp_data if not df.empty] or tmp_data[-1:]
             
+            parts = [df[df.index < nxt.index.array[0]] for df,nxt in zip(tmp_data[:-1],tmp_data[1:])]
+            
+            # parse_of trimmed the padding per file, concat takes the union of
+            # the columns when a restart adds some (e.g. new wave buoys)
+            d = pd.concat(parts + [tmp_data[-1]]) if parts else tmp_data[-1]
+            
+            # time stays the index for customize() and the user
             self.data = d
-            self.data.reset_index(inplace=True)
+            
+            # only remember the mtime once parsing succeeded, a failed
+            # read must not leave the reader 'up to date' without data
+            self.mtime = current_mtime
 
 
     def sort_fields(self):
-          
-        try: 
-            self.data = self.data.reindex(sorted(self.data.columns,key=lambda val: self.SORT_ORDER[val]),axis=1)
-        except KeyError as e:
-            pass 
-            #print(e)
+        
+        # columns missing in SORT_ORDER keep their order behind the known ones
+        order = self.SORT_ORDER
+        n = len(order)
+        
+        self.data = self.data.reindex(sorted(self.data.columns,key=lambda val: order.get(val,n)),axis=1)
 
     def fields(self):
         
-        f = list(self.data.columns)
-        f.remove('time')
-        
-        return f
+        return list(self.data.columns)
     
     def __str__(self):
         
         return str(self.data.head())
     
-    def __init__(self,base_dir,file_name,names=None,usecols=None,case_dir=None,tmin=None,tmax=None):
+    def __init__(self,base_dir,file_name,names=None,usecols=None,case_dir=None,tmin=None,tmax=None,header_line=None,dtype=None):
         
+        self._data = None
         self.mtime = 0
         self.up_to_date = False
         
@@ -124,14 +138,34 @@ class OpenFOAMpostProcessing(object):
         
         self.usecols = usecols
         
+        self.header_line = header_line
+        
+        self.dtype = dtype
+        
         self.base_dir = Path(self.case_dir,'postProcessing',base_dir)
-                   
-        self.load_data()
         
+        # nothing is read here, the files are parsed on first access of data
+        
+    @property
+    def data(self):
+        
+        self._ensure_loaded()
+        
+        return self._data
+    
+    @data.setter
+    def data(self,data):
+        
+        self._data = data
+    
+    def _ensure_loaded(self):
+        
+        if self._data is None:
+            self.load_data()
 
     def load_data(self):
         
-        self.combine_oftime_files(self.file_name, self.names, self.usecols)
+        self.combine_oftime_files(self.file_name, self.names, self.usecols, self.header_line, self.dtype)
 
         if not self.up_to_date:
             self.customize()
@@ -149,11 +183,16 @@ class OpenFOAMpostProcessing(object):
 
     def time_range(self):
 
-        if self.tmin is not None:
-            self.data = self.data[self.data['time'] > self.tmin]
+        if self.tmin is None and self.tmax is None:
+            return
+        
+        # time is sorted, look up the cut offs instead of masking every row
+        t = self.data.index.to_numpy()
+        
+        lo = np.searchsorted(t,self.tmin,side='right') if self.tmin is not None else 0
+        hi = np.searchsorted(t,self.tmax,side='left') if self.tmax is not None else len(t)
         
-        if self.tmax is not None:
-            self.data = self.data[self.data['time'] < self.tmax]
+        self.data = self.data.iloc[lo:hi]
 
 
 class OpenFOAMforces(OpenFOAMpostProcessing):
@@ -162,28 +201,38 @@ class OpenFOAMforces(OpenFOAMpostProcessing):
 
         self.SORT_ORDER = {'time':-1, "fx": 0}
         
-        super().__init__(base_dir=base_dir,file_name=file_name,case_dir=case_dir,names=None,usecols=None,tmin=tmin,tmax=tmax)
+        super().__init__(base_dir=base_dir,file_name=file_name,case_dir=case_dir,names=None,usecols=None,tmin=tmin,tmax=tmax,dtype=np.float64)
         
     def customize(self):
         OpenFOAMpostProcessing.customize(self)
 
         if not self.data.empty and self.usecols is None:
 
-            self.data.dropna(how='all',axis=1,inplace=True)            
+            usecols = ['time','fxp','fyp','fzp','fxv','fyv','fzv','mxp','myp','mzp','mxv','myv','mzv']
 
-            if len(self.data.columns == 13):
-                self.names = ['time','fxp','fyp','fzp','fxv','fyv','fzv','mxp','myp','mzp','mxv','myv','mzv']        
-            else:
-                self.names = ['time','fxp','fyp','fzp','fxv','fyv','fzv','fxpor','fypor','fzpor', 'mxp','myp','mzp','mxv','myv','mzv','mxpor','mypor','mzpor']
-
-            self.usecols = ['time','fxp','fyp','fzp','fxv','fyv','fzv','mxp','myp','mzp','mxv','myv','mzv']
-
-            for i in range(1,len(self.usecols)):
-                self.SORT_ORDER[self.usecols[i]] = i
+            for i in range(1,len(usecols)):
+                self.SORT_ORDER[usecols[i]] = i
             
-            mapper = dict(zip(self.data.columns,self.usecols))
+            # 12 force and moment components next to the time index, 18 with porosity
+            if len(self.data.columns) == 12:
+                names = usecols
+            elif len(self.data.columns) == 18:
+                names = ['time','fxp','fyp','fzp','fxv','fyv','fzv','fxpor','fypor','fzpor', 'mxp','myp','mzp','mxv','myv','mzv','mxpor','mypor','mzpor']
+            else:
+                names = None
             
-            self.data.rename(columns=mapper,inplace=True)        
+            # unknown layouts, e.g. total/pressure/viscous forces of newer
+            # versions, stay unlabelled and get no fx
+            if names is not None:
+                self.names = names
+                self.usecols = usecols
+                
+                mapper = dict(zip(self.data.columns,names[1:]))
+                
+                self.data.rename(columns=mapper,inplace=True)
+                
+                # drop the porous components, reloads skip them already while parsing
+                self.data = self.data[usecols[1:]]
         
         try:
             self.data['fx'] = self.data['fxp'] + self.data['fxv']
@@ -199,18 +248,16 @@ class OpenFOAMwaveBuoy(OpenFOAMpostProcessing):
     
     def __init__(self,base_dir='waveBuoy',file_name='height.dat',case_dir=None,tmin=None,tmax=None):
         
-        super().__init__(base_dir=base_dir, file_name=file_name, names=None, usecols=None, case_dir=case_dir, tmin=tmin, tmax=tmax)
+        super().__init__(base_dir=base_dir, file_name=file_name, names=None, usecols=None, case_dir=case_dir, tmin=tmin, tmax=tmax, dtype=_single_precision())
 
     def customize(self):
         OpenFOAMpostProcessing.customize(self)
         
-        self.data.dropna(how='all',axis=1,inplace=True)
-        
         # get only the height above the location, i. e. every second entry
-        cols = ['time'] + list(self.data)[2::2]
+        cols = list(self.data)[1::2]
         self.data = self.data.loc[:,cols]
         
-        mapDict = {key:f'buoy{i}' for i,key in enumerate(list(self.data)[1:]) }
+        mapDict = {key:f'buoy{i}' for i,key in enumerate(list(self.data)) }
         self.data.rename(columns=mapDict,inplace=True)
         
         
@@ -227,7 +274,7 @@ class OpenFOAMrigidBodyState(OpenFOAMpostProcessing):
 
         names = ['time','x','y','z','roll','pitch','yaw','vx','vy','vz','vroll','vpitch','vyaw','xvcorr','yvcorr','zvcorr']
         
-        super().__init__(base_dir=base_dir,file_name=file_name,names=names,usecols=None,case_dir=case_dir,tmin=tmin,tmax=tmax)
+        super().__init__(base_dir=base_dir,file_name=file_name,names=names,usecols=None,case_dir=case_dir,tmin=tmin,tmax=tmax,dtype=np.float64)
         
         
     def customize(self):
@@ -235,8 +282,10 @@ class OpenFOAMrigidBodyState(OpenFOAMpostProcessing):
         
         if self.data.size != 0:
             if self.subtractInitialCoG:
-                for dof in ['x','y','z']:
-                    self.data[dof] = self.data[dof] - self.data[dof].iloc[0]
+                # one array operation for all three coordinates, the result is a
+                # new array so cached frames of parse_of are not touched
+                cog = self.data[['x','y','z']].to_numpy()
+                self.data[['x','y','z']] = cog - cog[0]
         
         self.time_range()
 
@@ -246,36 +295,17 @@ class OpenFOAMresiduals(OpenFOAMpostProcessing):
         
         self.SORT_ORDER = {"U": 0, "Ux": 1, "Uy": 2, "Uz": 3, "p": 4, "p_rgh": 5, "k": 6, "omega":7,'time':-1}
         
-        super().__init__(base_dir=base_dir,file_name=file_name,names=None,usecols=None,case_dir=case_dir,tmin=tmin,tmax=tmax)
+        # residuals are only looked at on a log scale, single precision is plenty
+        super().__init__(base_dir=base_dir,file_name=file_name,names=None,usecols=None,case_dir=case_dir,tmin=tmin,tmax=tmax,header_line=1,dtype=_single_precision())
         
     
     def customize(self): 
         OpenFOAMpostProcessing.customize(self)
 
-        if not self.data.empty and self.usecols is None:
-        
-            self.data.dropna(how='all',axis=1,inplace=True)
-            
-            time_dirs = list_time_dirs(Path(self.base_dir))
-                        
-            with Path(self.base_dir,time_dirs[0],'residuals.dat').open('r') as f:
-                for i,line in enumerate(f):
-                    if i == 1:
-                        header = line
-                        break
-    
-            header = header.replace('#','').split()[:]
-            header[0] = 'time'
-    
-            self.names = header
-            self.usecols = header
-            
-            mapper = dict(zip(self.data.columns,self.usecols))
-            
-            self.data.rename(columns=mapper,inplace=True)
-
         try:
-            self.data['U'] = (np.abs(self.data['Ux'].pow(2) + self.data['Uy'].pow(2) + self.data['Uz'].pow(2)))/3.
+            uvec = self.data[['Ux','Uy','Uz']].to_numpy(dtype=np.float32)
+            # row wise dot product in a single kernel, a sum of squares needs no abs()
+            self.data['U'] = np.einsum('ij,ij->i',uvec,uvec)/3.
             self.data.drop(columns=['Ux','Uy','Uz'],inplace=True)    
         except KeyError:
             pass
@@ -289,33 +319,12 @@ class OpenFOAMtime(OpenFOAMpostProcessing):
     
     def __init__(self,base_dir,file_name='time.dat',case_dir=None,tmin=None,tmax=None):
         
-        super().__init__(base_dir=base_dir,file_name=file_name,names=None,usecols=None,case_dir=case_dir,tmin=tmin,tmax=tmax)
+        super().__init__(base_dir=base_dir,file_name=file_name,names=None,usecols=None,case_dir=case_dir,tmin=tmin,tmax=tmax,header_line=1,dtype=np.float64)
         
         
     def customize(self):
         OpenFOAMpostProcessing.customize(self)
-                
-        if not self.data.empty and self.usecols is None:
-            self.data.dropna(how='all',axis=1,inplace=True)
-            
-            time_dirs = list_time_dirs(Path(self.base_dir))
-            
-            with Path(self.base_dir,time_dirs[0],'time.dat').open('r') as f:
-                for i,line in enumerate(f):
-                    if i == 1:
-                        header = line
-                        break
-                    
-            header = header.replace('#','').split()[:]
-            header[0] = 'time'
-    
-            self.names = header
-            self.usecols = header
-            
-            mapper = dict(zip(self.data.columns,self.usecols))
-            
-            self.data.rename(columns=mapper,inplace=True)
-                
+        
         self.time_range()
         
         
@@ -326,25 +335,30 @@ class OpenFOAMfieldMinMax(OpenFOAMpostProcessing):
         names = ['time','field','min','locationX(min)','locationY(min)','locationZ(min)','processor(min)','max','locationX(max)','locationY(max)','locationZ(max)','processor(max)']
         usecols = ['time','field','min','max']
         
-        super().__init__(base_dir=base_dir,file_name=file_name,names=names,usecols=usecols,case_dir=case_dir,tmin=tmin,tmax=tmax)
+        dtype = {k:np.float64 for k in usecols}
+        dtype['field'] = 'category'
+        
+        super().__init__(base_dir=base_dir,file_name=file_name,names=names,usecols=usecols,case_dir=case_dir,tmin=tmin,tmax=tmax,dtype=dtype)
         
         
     def customize(self):
         OpenFOAMpostProcessing.customize(self)
         
+        # few distinct field names repeated on every line, already categorical
+        # per file but concatenating time dirs with different fields gives objects
+        self.data['field'] = self.data['field'].astype('category')
+        
         fields = self.data['field'].unique()
-    
-        dfs = [self.data.loc[self.data['field'] == field] for field in fields ]
-        dfs = [df.drop(columns=['field']) for df in dfs]
-        dfs = [df.set_index('time',drop=True) for df in dfs]
+        values = [k for k in self.data.columns if k != 'field']
         
-        for i,df in enumerate(dfs):
-            mapper = {k:"{0:}_{1:}".format(k,fields[i]) for k in list(df.columns)}
-            df.rename(columns=mapper,inplace=True)
+        # one reshape instead of filtering the frame once per field
+        data = self.data.pivot(columns='field',values=values)
         
-        self.data = pd.concat(dfs,axis=1)
+        # keep the column order of the files, i.e. min_p, max_p, min_U, ...
+        data = data.reindex(columns=[(k,field) for field in fields for k in values])
+        data.columns = ["{0:}_{1:}".format(k,field) for k,field in data.columns]
         
-        self.data['time'] = self.data.index
+        self.data = data
         
         self.time_range()
     
@@ -364,13 +378,17 @@ class OpenFOAMactuatorDiskLog(OpenFOAMpostProcessing):
         names = ['time','thrust','torque','vp','va','n','J','FD']
         usecols = ['time','thrust','torque','vp','va','n','J','FD']
         
+        super().__init__(base_dir=base_dir, file_name=file_name, names=names, usecols=usecols, case_dir=case_dir)
+    
+    def load_data(self):
+        
         try:
-            super().__init__(base_dir=base_dir, file_name=file_name, names=names, usecols=usecols, case_dir=case_dir)
+            OpenFOAMpostProcessing.load_data(self)
         except ParserError as e:
-            names = ['time','thrust','torque','vp','va','n','FD']
-            usecols = ['time','thrust','torque','vp','va','n','FD']
+            self.names = ['time','thrust','torque','vp','va','n','FD']
+            self.usecols = ['time','thrust','torque','vp','va','n','FD']
             
-            super().__init__(base_dir=base_dir, file_name=file_name, names=names, usecols=usecols, case_dir=case_dir)
+            OpenFOAMpostProcessing.load_data(self)
 
 
 def residuals(base_dir='residuals',case_dir=None):
@@ -0,0 +1,47 @@
+from pathlib import Path
+
+from octopost.postproc import OpenFOAMforces
+
+def write_forces(case_dir,lines):
+
+    p = Path(case_dir,'postProcessing','forces','0','forces.dat')
+    p.parent.mkdir(parents=True)
+    p.write_text('\n'.join(['# Force','# CofR : (0 0 0)','#'] + lines) + '\n')
+
+def vectors(v,n):
+
+    return ' '.join('(' + ' '.join(str(x) for x in v[3*i:3*i+3]) + ')' for i in range(n))
+
+def test_forces_13_columns(tmp_path):
+
+    v = list(range(12))
+    write_forces(tmp_path,[f'0.1\t({vectors(v[:6],2)}) ({vectors(v[6:],2)})'])
+
+    data = OpenFOAMforces(case_dir=tmp_path).data
+
+    assert list(data.columns) == ['fx','fxp','fyp','fzp','fxv','fyv','fzv','mxp','myp','mzp','mxv','myv','mzv']
+    assert data.loc[0.1].tolist() == [3,0,1,2,3,4,5,6,7,8,9,10,11]
+
+def test_forces_19_columns_porous(tmp_path):
+
+    v = list(range(18))
+    write_forces(tmp_path,[f'0.1\t({vectors(v[:9],3)}) ({vectors(v[9:],3)})'])
+
+    reader = OpenFOAMforces(case_dir=tmp_path)
+    data = reader.data
+
+    # porous components are dropped, moments start after them
+    assert list(data.columns) == ['fx','fxp','fyp','fzp','fxv','fyv','fzv','mxp','myp','mzp','mxv','myv','mzv']
+    assert data.loc[0.1].tolist() == [3,0,1,2,3,4,5,9,10,11,12,13,14]
+
+    # reloads parse only the used columns with the porous names
+    assert len(reader.names) == 19
+
+def test_forces_unknown_layout(tmp_path):
+
+    write_forces(tmp_path,['0.1\t' + ' '.join(str(x) for x in range(9))])
+
+    data = OpenFOAMforces(case_dir=tmp_path).data
+
+    # no guessing of the layout, columns stay unlabelled
+    assert list(data.columns) == ['c' + str(x) for x in range(9)]